@@ -1,15 +1,20 @@
 from bson.codec_options import CodecOptions
+from decimal import Decimal
 from pymongo import MongoClient
 
 import mysql.connector
 import mysql.connector.errors
 import numpy as np
 import pandas as pd
+import re
 import tkinter.messagebox as tkMessageBox
 import tkinter.simpledialog as tkSimpleDialog
 import urllib.parse
 
 
+type_pattern = re.compile(r"^\s*(\w+)\s*(?:\(([^)]*)\))?")
+
+
 class DBColumn(object):
     def __init__(self, name, dtype="VARCHAR(45)", allow_nulls=True, auto_increment=False, default=None):
         self.name = name
@@ -41,6 +46,48 @@ class DBColumn(object):
     def get_name(self):
         return self.name
 
+    def get_base_type(self):
+        """Return the SQL type without its parameters, e.g. `DECIMAL` for `DECIMAL(13,2)`."""
+        return type_pattern.match(self.type).group(1).upper()
+
+    def get_type_params(self):
+        """Return the integer parameters of the SQL type, e.g. (13, 2) for `DECIMAL(13,2)`."""
+        params = type_pattern.match(self.type).group(2)
+        if not params:
+            return ()
+        return tuple(int(p) for p in params.split(","))
+
+    def get_scale(self):
+        """Return the number of decimal places stored by a DECIMAL column, 0 otherwise."""
+        params = self.get_type_params()
+        if self.get_base_type() != "DECIMAL":
+            return 0
+        return params[1] if len(params) > 1 else 0
+
+    def unscale(self, value):
+        """Convert a DECIMAL value produced by `DBManager.compact_df()` back to a Decimal.
+
+        Scaled integers are shifted back by the column's scale, floats and Decimals are
+        converted as they are, so this works whichever `decimal_policy` was used."""
+        if pd.isna(value):
+            return None
+        if isinstance(value, Decimal):
+            return value
+        if isinstance(value, float):
+            return Decimal(str(value))
+        return Decimal(int(value)).scaleb(-self.get_scale())
+
+    def restore(self, value):
+        """Convert a value produced by `DBManager.compact_df()` back to the type MySQL returns for this column.
+
+        DECIMAL values are passed through `unscale()` and DATE values become `datetime.date` again."""
+        base_type = self.get_base_type()
+        if base_type == "DECIMAL":
+            return self.unscale(value)
+        if base_type == "DATE":
+            return None if pd.isna(value) else value.date()
+        return value
+
 
 class DBManager:
     _config = {}
@@ -83,6 +130,7 @@ class DBManager:
 
             assert(len(columns) > 0),\
                 f"{table} is not a known table, please pass `{table}` directly or add it to the `tables` dictionary."
+            columns = columns[0]
         elif isinstance(table, dict):
             columns = table["fields"]
         else:
@@ -124,6 +172,71 @@ class DBManager:
             return True
         return False
 
+    def compact_df(self, df, table, decimal_policy="scaled", category_threshold=0.5):
+        """Downcast the columns of `df` using the DBColumn metadata of `table`.
+
+        VARCHAR columns become categorical when their unique values make up no more than
+        `category_threshold` of the rows. INT columns use the smallest integer width that fits.
+        DECIMAL columns follow `decimal_policy`:
+            "scaled" stores exact integers of the smallest unit (e.g. cents), see `DBColumn.unscale()`,
+                and is only allowed when the precision is at most 18 digits,
+            "float" stores float64 and is only allowed when the precision is at most 15 digits,
+            "decimal" leaves the Decimal objects untouched.
+        DECIMAL columns containing NULLs are left as Decimal objects under the "scaled" policy.
+        DATE columns become datetime64, NULLs becoming NaT.
+        Use `DBColumn.restore()` to get the original values back before writing them elsewhere.
+        """
+        if decimal_policy not in ("scaled", "float", "decimal"):
+            raise ValueError(
+                "`decimal_policy` expects one of: `scaled`, `float`, `decimal`."
+            )
+
+        columns = self.get_table_cols_dict(table)
+        for name in df.columns:
+            if name not in columns:
+                continue
+
+            col = columns[name]
+            base_type = col.get_base_type()
+            series = df[name]
+            has_nulls = bool(series.isna().any())
+
+            if base_type in ("VARCHAR", "CHAR"):
+                if len(series) > 0 and series.nunique() <= len(series) * category_threshold:
+                    df[name] = series.astype("category")
+            elif base_type in ("TINYINT", "SMALLINT", "MEDIUMINT", "INT", "INTEGER", "BIGINT"):
+                if not has_nulls:
+                    df[name] = pd.to_numeric(series, downcast="integer")
+            elif base_type == "DECIMAL" and decimal_policy == "scaled":
+                params = col.get_type_params()
+                if params and params[0] > 18:
+                    raise ValueError(
+                        f"`{name}` has a precision of {params[0]} digits which cannot be stored exactly as a scaled integer."
+                    )
+                if not has_nulls:
+                    scale = col.get_scale()
+                    df[name] = pd.to_numeric(
+                        series.map(lambda v: int(
+                            Decimal(str(v)).scaleb(scale).to_integral_value())),
+                        downcast="integer"
+                    )
+            elif base_type == "DECIMAL" and decimal_policy == "float":
+                params = col.get_type_params()
+                if params and params[0] > 15:
+                    raise ValueError(
+                        f"`{name}` has a precision of {params[0]} digits which cannot be stored exactly as a float."
+                    )
+                df[name] = series.astype("float64")
+            elif base_type == "DATE":
+                df[name] = pd.to_datetime(series)
+
+        return df
+
+    @staticmethod
+    def get_df_memory(df):
+        """Return the number of bytes used by `df`, including the contents of object columns."""
+        return int(df.memory_usage(deep=True).sum())
+
     @staticmethod
     def store_data(key, data, allow_overwrite=True):
         if allow_overwrite:
@@ -142,6 +255,10 @@ class DBManager:
     def isdataset(key):
         return key in DBManager._data_store
 
+    @staticmethod
+    def clear_data(key):
+        DBManager._data_store.pop(key, None)
+
 
 class MySQLManager(DBManager):
     _config = {
@@ -274,7 +391,7 @@ class MySQLManager(DBManager):
             cursor.execute(stmt)
             return cursor.fetchall()
 
-    def get_dbdata(self, table: str = None) -> pd.DataFrame:
+    def get_dbdata(self, table: str = None, compact: bool = False, decimal_policy: str = "scaled") -> pd.DataFrame:
         if self.isconfigset("table"):
             tablename = self.getconfig("table")
         tablename = table or tablename
@@ -293,6 +410,9 @@ class MySQLManager(DBManager):
             data = cursor.fetchall()
 
         data_df = pd.DataFrame(data, columns=cols)
+        if compact:
+            data_df = self.compact_df(
+                data_df, tablename, decimal_policy=decimal_policy)
         return data_df
 
     def add_df_to_db(self, df, table: str = "", suppress: str = ""):
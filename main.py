@@ -5,15 +5,23 @@ from decimal import Decimal
 from pymongo import MongoClient
 from pymongo.results import InsertManyResult, UpdateResult
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import argparse
 import atexit
 import datetime as dtime
 import pandas as pd
 import pprint
 import re
+import sys
+import threading
+import time
 import urllib.parse
 
 
 int_pattern = re.compile("^(\d+)$")
+cache_lock = threading.Lock()
+reports_lock = threading.Lock()
 
 
 class DecimalCodec(TypeCodec):
@@ -93,39 +101,118 @@ def perform_operations():
         print("")
 
 
+def perform_batch(operations, max_workers=4):
+    """Run the named operations without prompting and return an exit status.
+
+    Each operation waits for the operations it depends on (see `operation_dependencies`)
+    when they are part of the same batch; operations that do not depend on each other run
+    concurrently. Steps whose dependencies failed are skipped.
+
+    Operation names are validated here as well as by the `--batch` argument parser, so
+    this can also be called from code; unknown names return an exit status of 2."""
+    unknown = [name for name in operations if name not in batch_operations]
+    if unknown:
+        print(f"Unknown operation(s): {', '.join(unknown)}")
+        return 2
+
+    pending = list(dict.fromkeys(operations))
+    results = {}
+    timings = {}
+    running = {}
+    skipped = set()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for name in list(pending):
+                deps = [d for d in operation_dependencies.get(name, ())
+                        if d in operations]
+                if any(results.get(d, (1,))[0] <= 0 for d in deps):
+                    pending.remove(name)
+                    results[name] = (0, "Skipped as a dependency failed.")
+                    timings[name] = 0.0
+                    skipped.add(name)
+                elif all(d in results for d in deps):
+                    pending.remove(name)
+                    running[executor.submit(
+                        run_timed, batch_operations[name])] = name
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name], timings[name] = future.result()
+                print(f"[{prettify_func_name(name)}] {results[name][1]}")
+
+    print("")
+    print("Batch Summary:")
+    for name in dict.fromkeys(operations):
+        status = "OK" if results[name][0] > 0 else "FAILED"
+        if name in skipped:
+            status = "SKIPPED"
+        print(f"{status:>7}  {timings[name]:8.2f}s  {prettify_func_name(name)}")
+
+    return 0 if all(res[0] > 0 for res in results.values()) else 1
+
+
+def run_timed(func):
+    start = time.perf_counter()
+    try:
+        res = func()
+    except Exception as err:
+        res = 0, f"Failed with {type(err).__name__}: {err}"
+    return res, time.perf_counter() - start
+
+
 def quit_program():
     return -1, "Quitting Program..."
 
 
 def transfer_products():
     mysql = DBManager.retrieve_data("mysql")
-    mongo = DBManager.retrieve_data("mongo")
 
     # Firstly, get MySQL for conversion.
-    products_df = mysql.get_dbdata("products")
-    categories_df = mysql.get_dbdata("categories")
-    product_sales_df = mysql.get_dbdata("product_sales")
+    products_df = mysql.get_dbdata("products", compact=True)
+    categories_df = mysql.get_dbdata("categories", compact=True)
+    product_sales_df = mysql.get_dbdata("product_sales", compact=True)
+
+    report_df_memory("products", products_df)
+    report_df_memory("categories", categories_df)
+    report_df_memory("product_sales", product_sales_df)
 
+    categories = categories_df.set_index("id_category")["title"].astype(object)
     products_df.rename(columns={"id_category": "category"}, inplace=True)
-    for _, row in categories_df.iterrows():
-        mask = products_df.loc[:, "category"] == row["id_category"]
-        products_df.loc[mask, "category"] = row["title"]
+    products_df["category"] = products_df["category"].map(
+        categories).fillna(products_df["category"]).astype("category")
+
+    product_cols = get_restore_cols(mysql, "products")
+    sale_cols = get_restore_cols(mysql, "product_sales")
+
+    sales_by_product = {}
+    for sale in product_sales_df.drop(columns=["id_sale"]).to_dict(orient="records"):
+        for name in sale_cols:
+            sale[name] = sale_cols[name].restore(sale[name])
+        sales_by_product.setdefault(sale.pop("id_product"), []).append(sale)
 
     products_df.rename(columns={"id_product": "_id"}, inplace=True)
     products_data = products_df.to_dict(orient="records")
+    del products_df, categories_df, categories, product_sales_df
+
     for p in products_data:
-        sales = product_sales_df.loc[product_sales_df.loc[:,
-                                                          "id_product"] == p["_id"]].copy()
-        sales.drop(columns=["id_sale", "id_product"], inplace=True)
-        p["sales"] = sales.to_dict(orient="records")
+        p["sales"] = sales_by_product.pop(p["_id"], [])
+
+        for name in product_cols:
+            p[name] = product_cols[name].restore(p[name])
 
-        if p["brand"] is None:
+        if pd.isna(p["brand"]):
             del p["brand"]
 
     # Insert data from MySQL into Mongo.
-    db_datatracker = mongo.get_database()
+    db_datatracker = get_datatracker()
     coll_products = db_datatracker["products"]
 
+    DBManager.clear_data("sales_reports")
     coll_products.drop()
     insert_res = coll_products.insert_many(products_data)
     if isinstance(insert_res, InsertManyResult) and (len(insert_res.inserted_ids) > 0):
@@ -137,7 +224,6 @@ def transfer_products():
 
 def create_top_3():
     mysql = DBManager.retrieve_data("mysql")
-    mongo = DBManager.retrieve_data("mongo")
 
     # c = ["id_product",
     #      "YEAR(period) as `sold_year`, AVG(sold) as `sold_average`"]
@@ -147,22 +233,9 @@ def create_top_3():
     # top3 = mysql.select(tablename="product_sales", columns=c,
     #                     where=w, groupby=g, order=o, limit=3)
 
-    db_datatracker = mongo.get_database()
-    coll_products = db_datatracker["products"]
+    db_datatracker = get_datatracker()
 
-    top3 = coll_products.aggregate([
-        {"$match": {"sales.0": {"$exists": True}}},
-        {"$unwind": "$sales"},
-        {"$group": {"_id": "$_id", "doc": {"$first": "$$ROOT"}, "totalSales": {
-            "$sum": "$sales.sold"}}},
-        {"$replaceRoot": {
-            "newRoot": {"$mergeObjects": ["$doc", {"totalSales": "$totalSales"}]}}},
-        {"$unset": "sales"},
-        {"$sort": {"totalSales": -1}},
-        {"$limit": 3}
-    ])
-
-    data_top3 = list(top3)
+    data_top3 = [item.copy() for item in get_sales_reports()["top3"]]
     pos = 0
     for item in data_top3:
         item["position"] = pos
@@ -183,9 +256,7 @@ def create_top_3():
 
 
 def drop_brands():
-    mongo = DBManager.retrieve_data("mongo")
-
-    db_datatracker = mongo.get_database()
+    db_datatracker = get_datatracker()
     coll_top_products = db_datatracker["top_products"]
 
     data_top_products = coll_top_products.find({})
@@ -202,9 +273,7 @@ def drop_brands():
 
 
 def update_product():
-    mongo = DBManager.retrieve_data("mongo")
-
-    db_datatracker = mongo.get_database()
+    db_datatracker = get_datatracker()
     coll_top_products = db_datatracker["top_products"]
 
     res_update = coll_top_products.find_one_and_update(
@@ -218,26 +287,71 @@ def update_product():
 
 
 def create_worst_5_brands():
-    mongo = DBManager.retrieve_data("mongo")
-
-    db_datatracker = mongo.get_database()
-    coll_products = db_datatracker["products"]
-
-    worst5 = coll_products.aggregate([
-        {"$match": {"sales.0": {"$exists": True}, "brand": {"$exists": True}}},
-        {"$unwind": "$sales"},
-        {"$group": {"_id": "$brand", "totalSales": {"$sum": "$sales.sold"}}},
-        {"$sort": {"totalSales": 1, "brand": 1}},
-        {"$limit": 5}
-    ])
-
-    print("")
-    print("The following are the 5 worst brands in the store.")
+    worst5 = get_sales_reports()["worst5"]
 
+    out = "\nThe following are the 5 worst brands in the store."
     for level, brand in enumerate(worst5):
-        print(f"{level+1} -> {brand['_id']}")
-
-    return 1, ""
+        out += f"\n{level+1} -> {brand['_id']}"
+
+    return 1, out
+
+
+def get_datatracker():
+    """Return the `DataTracker` database, opening it once and caching it in the data store."""
+    with cache_lock:
+        if not DBManager.isdataset("datatracker"):
+            mongo = DBManager.retrieve_data("mongo")
+            DBManager.store_data("datatracker", mongo.get_database())
+        return DBManager.retrieve_data("datatracker")
+
+
+def get_sales_reports():
+    """Return the `top3` products and `worst5` brands by total sales.
+
+    Both reports come from a single `$facet` aggregation over the `products` collection,
+    so only 8 documents are sent back. The result is cached until the next `transfer_products()`.
+    Concurrent callers wait for the first one's aggregation rather than running their own, so in a
+    batch `create_top_3` and `create_worst_5_brands` share it instead of running in parallel."""
+    db_datatracker = get_datatracker()
+
+    with reports_lock:
+        if not DBManager.isdataset("sales_reports"):
+            coll_products = db_datatracker["products"]
+            reports = coll_products.aggregate([
+                {"$match": {"sales.0": {"$exists": True}}},
+                {"$unwind": "$sales"},
+                {"$group": {"_id": "$_id", "doc": {"$first": "$$ROOT"}, "totalSales": {
+                    "$sum": "$sales.sold"}}},
+                {"$replaceRoot": {
+                    "newRoot": {"$mergeObjects": ["$doc", {"totalSales": "$totalSales"}]}}},
+                {"$unset": "sales"},
+                {"$facet": {
+                    "top3": [
+                        {"$sort": {"totalSales": -1}},
+                        {"$limit": 3}
+                    ],
+                    "worst5": [
+                        {"$match": {"brand": {"$exists": True}}},
+                        {"$group": {"_id": "$brand", "totalSales": {
+                            "$sum": "$totalSales"}}},
+                        {"$sort": {"totalSales": 1, "_id": 1}},
+                        {"$limit": 5}
+                    ]
+                }}
+            ])
+            DBManager.store_data("sales_reports", next(
+                reports, {"top3": [], "worst5": []}))
+        return DBManager.retrieve_data("sales_reports")
+
+
+def report_df_memory(name, df):
+    print(f"Loaded `{name}`: {len(df)} rows, {prettify_bytes(DBManager.get_df_memory(df))}")
+
+
+def get_restore_cols(manager, table):
+    """Return the columns of `table` whose compacted values need `DBColumn.restore()`."""
+    return {name: col for name, col in manager.get_table_cols_dict(table).items()
+            if col.get_base_type() in ("DECIMAL", "DATE")}
 
 
 def prettify_func_name(name):
@@ -246,11 +360,49 @@ def prettify_func_name(name):
     )
 
 
+def prettify_bytes(size):
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
 def get_int(val):
     match = int_pattern.search(val)
     return int(match.group(0)) if match is not None else None
 
 
+batch_operations = {
+    func.__name__: func for func in (
+        transfer_products,
+        create_top_3,
+        drop_brands,
+        update_product,
+        create_worst_5_brands
+    )
+}
+
+# Operations that must finish before another operation can start when both are in a batch.
+operation_dependencies = {
+    "create_top_3": ("transfer_products",),
+    "drop_brands": ("create_top_3",),
+    "update_product": ("create_top_3", "drop_brands"),
+    "create_worst_5_brands": ("transfer_products",)
+}
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DataVault Inc. data tracker.")
+    parser.add_argument("--batch", nargs="+", metavar="OPERATION", choices=list(batch_operations),
+                        help="run the given operations without prompting, e.g. --batch transfer_products create_top_3")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="maximum number of operations to run at once in batch mode")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
     setup()
+    if args.batch:
+        sys.exit(perform_batch(args.batch, max_workers=args.workers))
     perform_operations()